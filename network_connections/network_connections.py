@@ -1,9 +1,23 @@
 from winreg import *
 import requests
+import sqlite3
 import json
+import math
 import sys
+import re
 import os
 
+# Wigle locations are stored in a SQLite table bucketed by geohash for proximity queries
+INDEX_FILE = "locations.db"
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Precision 7 -> cells of about 150m x 150m
+GEOHASH_PRECISION = 7
+# Maximum number of geohash cells scanned by a bounding box query
+MAX_QUERY_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+# Whitespaces and commas between two responses of a result file
+JSON_SEPARATOR = re.compile(r"[\s,]*")
+
 
 def val2addr(val):
     """Retrieve a MAC address value from hex bytes in the Windows Registry"""
@@ -64,6 +78,225 @@ def query_mac(mac, api_name, api_token):
         sys.exit(1)
 
 
+def iter_wigle_responses(json_file, chunk_size=1024 * 1024):
+    """Read the Wigle responses stored in a result file one by one without loading the whole file
+    : Input: Path to a result file (a json list of Wigle responses)
+    : Output: Generator of Wigle responses"""
+    decoder = json.JSONDecoder()
+    with open(json_file, "r") as json_input:
+        buffer = json_input.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            print("[-] {} is not a list of Wigle responses!".format(json_file))
+            return
+        # Decode from an index into the buffer instead of copying the rest of the buffer after each response
+        index = 1
+
+        while True:
+            # Skip the separator between two responses
+            index = JSON_SEPARATOR.match(buffer, index).end()
+            if buffer.startswith("]", index):
+                return
+            try:
+                response, index = decoder.raw_decode(buffer, index)
+            except json.JSONDecodeError as error:
+                # The error is followed by more than a chunk of data -> the response is malformed, not cut
+                # (a cut string reports its start, the chunks are far larger than any value of a Wigle response)
+                if len(buffer) - error.pos > chunk_size:
+                    raise
+                # The response is cut at the end of the buffer -> drop the decoded responses and read the next chunk
+                chunk = json_input.read(chunk_size)
+                if not chunk:
+                    # The file ends in the middle of a value (E.g: an open string or a partial literal) -> truncated
+                    # Anything else still follows the error position -> the response is malformed
+                    remainder = buffer[error.pos:].rstrip()
+                    if not error.msg.startswith("Unterminated string") and any(char in remainder for char in ",:]} "):
+                        raise
+                    print("[-] {} is truncated! ({})".format(json_file, error))
+                    return
+                buffer = buffer[index:] + chunk
+                index = 0
+                continue
+            yield response
+
+
+def iter_location_records(response):
+    """Normalize the networks of a Wigle response into location records
+    : Input: A Wigle search response
+    : Output: Generator of dictionaries with BSSID, SSID, location and first/last seen time"""
+    for network in response.get("results", []):
+        # Skip the networks that Wigle could not locate
+        if network.get("trilat") is None or network.get("trilong") is None:
+            continue
+        yield {
+            "BSSID": network.get("netid", "").lower(),
+            "SSID": network.get("ssid"),
+            "Latitude": float(network["trilat"]),
+            "Longitude": float(network["trilong"]),
+            "First Time": network.get("firsttime"),
+            "Last Time": network.get("lasttime")
+        }
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Encode a location to a geohash
+    : Input: Latitude, longitude and the length of the geohash
+    : Output: Geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    value = 0
+    # Bits alternate between longitude and latitude, starting with longitude
+    even = True
+    while len(geohash) < precision:
+        coord_range, coord = (lon_range, lon) if even else (lat_range, lat)
+        middle = (coord_range[0] + coord_range[1]) / 2
+        value <<= 1
+        if coord >= middle:
+            value |= 1
+            coord_range[0] = middle
+        else:
+            coord_range[1] = middle
+        even = not even
+        bits += 1
+        # Every 5 bits make a base32 character
+        if bits == 5:
+            geohash.append(GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(geohash)
+
+
+def geohash_cells(min_lat, min_lon, max_lat, max_lon):
+    """List the geohash cells covering a bounding box
+    : Input: South, west, north and east bounds of the box
+    : Output: A set of geohash prefixes (the longest precision that needs at most MAX_QUERY_CELLS cells)"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        # Size of a cell in degrees at this precision
+        lon_bits = (5 * precision + 1) // 2
+        lat_bits = 5 * precision // 2
+        cell_lat = 180.0 / 2 ** lat_bits
+        cell_lon = 360.0 / 2 ** lon_bits
+        lat_steps = int((max_lat - min_lat) / cell_lat) + 1
+        lon_steps = int((max_lon - min_lon) / cell_lon) + 1
+        if (lat_steps + 1) * (lon_steps + 1) <= MAX_QUERY_CELLS or precision == 1:
+            break
+
+    # Sample the box at every cell size, plus its north and east edges
+    lats = [min(min_lat + i * cell_lat, max_lat)
+            for i in range(lat_steps)] + [max_lat]
+    lons = [min(min_lon + i * cell_lon, max_lon)
+            for i in range(lon_steps)] + [max_lon]
+    return {geohash_encode(lat, lon, precision) for lat in lats for lon in lons}
+
+
+def open_location_index(db_file=INDEX_FILE):
+    """Open (and create if needed) the location index
+    : Input: Path to the SQLite database
+    : Output: SQLite connection"""
+    conn = sqlite3.connect(db_file)
+    conn.execute("""CREATE TABLE IF NOT EXISTS locations (
+                        bssid TEXT NOT NULL,
+                        ssid TEXT,
+                        lat REAL NOT NULL,
+                        lon REAL NOT NULL,
+                        first_time TEXT,
+                        last_time TEXT,
+                        geohash TEXT NOT NULL,
+                        PRIMARY KEY (bssid, lat, lon))""")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS locations_geohash ON locations (geohash)")
+    return conn
+
+
+def index_records(conn, records):
+    """Store location records in the location index
+    : Input: SQLite connection and an iterable of location records
+    : Output: Number of records stored"""
+    changes = conn.total_changes
+    # Records are consumed one by one -> the whole result never needs to be in memory
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         ((record["BSSID"], record["SSID"], record["Latitude"], record["Longitude"],
+                           record["First Time"], record["Last Time"],
+                           geohash_encode(record["Latitude"], record["Longitude"]))
+                          for record in records))
+    return conn.total_changes - changes
+
+
+def index_result_file(conn, json_file):
+    """Store every location of a result file in the location index
+    : Input: SQLite connection and path to a result file
+    : Output: Number of records stored"""
+    count = 0
+    for response in iter_wigle_responses(json_file):
+        count += index_records(conn, iter_location_records(response))
+    return count
+
+
+def query_bbox(conn, min_lat, min_lon, max_lat, max_lon):
+    """Find the networks located inside a bounding box
+    : Input: SQLite connection, south, west, north and east bounds of the box
+    : Output: A list of location records"""
+    records = []
+    for cell in geohash_cells(min_lat, min_lon, max_lat, max_lon):
+        # Geohashes sharing the cell prefix sort between the prefix and the prefix followed by "{" (after "z")
+        rows = conn.execute("""SELECT bssid, ssid, lat, lon, first_time, last_time FROM locations
+                               WHERE geohash >= ? AND geohash < ?
+                               AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?""",
+                            (cell, cell + "{", min_lat, max_lat, min_lon, max_lon))
+        for bssid, ssid, lat, lon, first_time, last_time in rows:
+            records.append({"BSSID": bssid, "SSID": ssid, "Latitude": lat, "Longitude": lon,
+                            "First Time": first_time, "Last Time": last_time})
+    return records
+
+
+def query_radius(conn, lat, lon, radius_km):
+    """Find the networks located within a distance of a location
+    : Input: SQLite connection, latitude and longitude of the location, radius in kilometers
+    : Output: A list of location records with their distance, closest first"""
+    # Bounding box of the circle then keep only the records inside the circle
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angle)
+    min_lat = max(lat - delta_lat, -90.0)
+    max_lat = min(lat + delta_lat, 90.0)
+    # The circle reaches a pole -> it covers every longitude
+    if min_lat == -90.0 or max_lat == 90.0 or math.sin(angle) >= math.cos(math.radians(lat)):
+        boxes = [(min_lat, -180.0, max_lat, 180.0)]
+    else:
+        delta_lon = math.degrees(
+            math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+        boxes = [(min_lat, lon - delta_lon, max_lat, lon + delta_lon)]
+        # Split the box in two if it crosses the 180th meridian
+        if lon - delta_lon < -180.0:
+            boxes = [(min_lat, -180.0, max_lat, lon + delta_lon),
+                     (min_lat, lon - delta_lon + 360.0, max_lat, 180.0)]
+        elif lon + delta_lon > 180.0:
+            boxes = [(min_lat, lon - delta_lon, max_lat, 180.0),
+                     (min_lat, -180.0, max_lat, lon + delta_lon - 360.0)]
+    records = []
+    for box in boxes:
+        records.extend(query_bbox(conn, *box))
+
+    nearby = []
+    for record in records:
+        distance = haversine(lat, lon, record["Latitude"], record["Longitude"])
+        if distance <= radius_km:
+            record["Distance (km)"] = round(distance, 3)
+            nearby.append(record)
+    return sorted(nearby, key=lambda record: record["Distance (km)"])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Compute the great circle distance between two locations
+    : Input: Latitude and longitude of both locations
+    : Output: Distance in kilometers"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * \
+        math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
 if __name__ == "__main__":
     # Get network that the computer has connected
     networks_dict, count = printNets()
@@ -90,7 +323,7 @@ if __name__ == "__main__":
 
             # Append result to the file if the query is successful
             if w_reply["success"] == True:
-                finished_network.append[mac]
+                finished_network.append(mac)
                 print("[+] {} finished".format(mac))
                 json_result.append(w_reply)
 
@@ -105,7 +338,16 @@ if __name__ == "__main__":
         if json_result:
             with open(out_file, "w") as json_output:
                 json.dump(json_result, json_output, indent=3)
-            print("[+] File store in {}\\".format(os.getcwd(), out_file))
+            print("[+] File store in {}\\{}".format(os.getcwd(), out_file))
+
+            # Store the network locations in the location index for proximity queries
+            conn = open_location_index()
+            stored = 0
+            for w_reply in json_result:
+                stored += index_records(conn, iter_location_records(w_reply))
+            conn.close()
+            print("[+] {} locations stored in {}\\{}".format(
+                stored, os.getcwd(), INDEX_FILE))
 
         # Process the unsearched results
         unsearched = []
@@ -115,7 +357,7 @@ if __name__ == "__main__":
         with open("unsearched.json", "w") as left_over:
             json.dump(unsearched, left_over, indent=3)
         print(
-            "[*] Unsearched addresses will be store in {}\unsearched.json".format(os.getcwd()))
+            "[*] Unsearched addresses will be store in {}\\unsearched.json".format(os.getcwd()))
 
     else:
         print("[+] Exiting!")
@@ -1,19 +1,41 @@
 from Registry import Registry
 import struct
 import sys
+import os
 import codecs
+import hashlib
 from datetime import *
 import re
 import json
 import yaml
 import csv
 
+# Parse results are cached on disk and keyed by the content hash of the registry hive
+# Bump the parser version whenever process_hive's output changes to invalidate old entries
+PARSER_VERSION = "1"
+CACHE_DIR = os.path.join(os.path.expanduser(
+    "~"), ".cache", "digital-forensics", "recent_run")
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+# Size of the cache, computed on the first write then tracked by cache_store()
+cache_size = None
+
 
 def process_hive(registry_hive):
     """Parse registry hive's UserAssist key to retrieve information of recent run programs
     : Input: Path to the registry hive
     : Output: A list containing multiple dictionary of recent run programs information
     """
+    # Return the cached result if an identical hive has been processed before
+    try:
+        key = cache_key(registry_hive, "userassist")
+    except FileNotFoundError:
+        print("[-] {} could not be found!".format(registry_hive))
+        sys.exit(1)
+    cached_list = cache_load(key)
+    if cached_list is not None:
+        # Raw data is stored as hex strings in the cache
+        return [{app_name: bytes.fromhex(raw_data) for app_name, raw_data in app.items()} for app in cached_list]
+
     # Try to open the registry hive and capture the errrors
     try:
         reg = Registry.Registry(registry_hive)
@@ -59,9 +81,120 @@ def process_hive(registry_hive):
                 app[app_name] = program.raw_data()
             # Add the current value of the app dictionary to apps_list
             apps_list.append(app)
+
+    # Binary values are not json serializable -> store them as hex strings
+    cache_store(key, [{app_name: raw_data.hex() for app_name, raw_data in app.items()}
+                      for app in apps_list])
     return apps_list
 
 
+# The result cache (hash_file() to evict_cache()) is duplicated in usb_lookup/usb_lookup.py since both scripts are standalone
+# -> keep both copies in sync when changing it
+def hash_file(file_path):
+    """Compute the BLAKE2 digest of a file by reading it in chunks
+    : Input: Path to the file
+    : Output: Hex digest of the file content"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, "rb") as artifact:
+        for chunk in iter(lambda: artifact.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(file_path, options):
+    """Build the cache key of an artifact
+    : Input: Path to the artifact and a string describing the parser options
+    : Output: Key made from the content hash, the parser version and the options"""
+    key = "{}|{}|{}".format(hash_file(file_path), PARSER_VERSION, options)
+    return hashlib.blake2b(key.encode(), digest_size=32).hexdigest()
+
+
+def cache_load(key):
+    """Load a parse result from the cache
+    : Input: Cache key
+    : Output: The cached result or None if the key is not in the cache"""
+    cache_file = os.path.join(CACHE_DIR, "{}.json".format(key))
+    try:
+        with open(cache_file, "r") as cached:
+            result = json.load(cached)
+        # Touch the entry so that the eviction sees it as recently used
+        os.utime(cache_file)
+    except (OSError, ValueError):
+        return None
+    return result
+
+
+def cache_store(key, result):
+    """Store a parse result in the cache then evict the least recently used entries if the cache is too large
+    : Input: Cache key and the result to store
+    : Output: None"""
+    global cache_size
+    cache_file = os.path.join(CACHE_DIR, "{}.json".format(key))
+    # Each process writes to its own temporary file so that concurrent runs do not collide
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    # A cache failure should never stop the parsing -> ignore write errors
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_file, "w") as cached:
+            json.dump(result, cached)
+        entry_size = os.path.getsize(tmp_file)
+        replaced_size = os.path.getsize(
+            cache_file) if os.path.exists(cache_file) else 0
+        os.replace(tmp_file, cache_file)
+
+        # Only list the cache directory on the first write, then keep track of its size
+        if cache_size is None:
+            cache_size = directory_size()
+        else:
+            cache_size += entry_size - replaced_size
+        if cache_size > CACHE_MAX_SIZE:
+            evict_cache()
+    except OSError:
+        pass
+
+
+def cache_entries():
+    """List the entries of the cache, skipping the temporary files being written
+    : Input: None
+    : Output: A list of (modification time, size, file name)"""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            entry = os.stat(os.path.join(CACHE_DIR, name))
+        except FileNotFoundError:
+            # Removed by another process in the meantime
+            continue
+        entries.append((entry.st_mtime, entry.st_size, name))
+    return entries
+
+
+def directory_size():
+    """Compute the size of the cache
+    : Input: None
+    : Output: Total size of the cache entries in bytes"""
+    return sum(size for _, size, _ in cache_entries())
+
+
+def evict_cache():
+    """Remove the least recently used cache entries until the cache fits in CACHE_MAX_SIZE
+    : Input: None
+    : Output: None"""
+    global cache_size
+    entries = cache_entries()
+    cache_size = sum(size for _, size, _ in entries)
+    # Oldest modification time first -> least recently used first
+    for _, size, name in sorted(entries):
+        if cache_size <= CACHE_MAX_SIZE:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+
+
 def parse_value(apps_list):
     """Parse binary part of the registry to readable integer information
     : Input: List of multiple dictionaries with binary string as the value
@@ -1,8 +1,33 @@
 import requests
+from datetime import datetime
+import hashlib
+import heapq
+import json
 import sys
 import os
 import re
 
+# Parse results are cached on disk and keyed by the content hash of the log file
+# Bump the parser version whenever the parsers' output changes to invalidate old entries
+PARSER_VERSION = "3"
+CACHE_DIR = os.path.join(os.path.expanduser(
+    "~"), ".cache", "digital-forensics", "usb_lookup")
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+# Size of the cache, computed on the first write then tracked by cache_store()
+cache_size = None
+
+# Format of the dates in the setupapi logs (milliseconds are optional)
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+# Maximum number of devices kept in memory while aggregating logs from a fleet
+MAX_TRACKED_DEVICES = 100000
+
+# Compile regex to capture desired information from device strings
+# (?:) Use to ignore group capture
+VENDOR_CAPTURE = re.compile(r"(?:(?:ven)|(?:vid))_(.*?)&")
+PRODUCT_CAPTURE = re.compile(r"(?:(?:pid)|(?:dev)|(?:prod))_(.*?)(&|\\)")
+REVISION_CAPTURE = re.compile(r"(?:(?:mi)|(?:rev))_(.*?)(\\|,)")
+
 
 def get_vendor_info():
     """Making request to Linux usb information database to retrieve devices information
@@ -80,139 +105,541 @@ def usb_lookup(vendor_id, product_id, vendor_dict):
     return vendor, product
 
 
-def process_device_info(device_dict):
+def decode_device(device):
     """Using regular expression to segregate parameter from the device string
-    : Input: Devices dictionary with device string as the key
-    : Output: A list of devices information"""
-
-    devices = []
-    # for device in device_dict.keys():
-    for device, date in device_dict.items():
-        # Pre-declare parameters
-        vid = ""
-        pid = ""
-        rev = ""
-        uid = ""
-        # Compile regex to capture desired information
-        # (?:) Use to ignore group capture
-        # Capture vendor info
-        vendor_capture = re.compile(r"(?:(?:ven)|(?:vid))_(.*?)&")
-        vendor_id = vendor_capture.search(device)
-        if vendor_id:
-            vid = vendor_id.group(1)
-
-        # Capture product info
-        product_capture = re.compile(
-            r"(?:(?:pid)|(?:dev)|(?:prod))_(.*?)(&|\\)")
-        product_id = product_capture.search(device)
-        if product_id:
-            pid = product_id.group(1)
-
-        # Capture revision info
-        revision_capture = re.compile(r"(?:(?:mi)|(?:rev))_(.*?)(\\|,)")
-        revision_id = revision_capture.search(device)
-        if revision_id:
-            rev = revision_id.group(1)
-
-        # Capture uid info
-        uid = device.split("\\")[2]
-        if vid != "" or pid != "":
-            devices.append({"Vendor ID": vid, "Product ID": pid,
-                            "Revision": rev, "UID": uid, "First Installation Date": date})
-    return devices
-
-
-def parse_device_from_log(log_file):
+    : Input: A device string
+    : Output: A dictionary of the device information or None if the string has no vendor or product id"""
+    # Pre-declare parameters
+    vid = ""
+    pid = ""
+    rev = ""
+    uid = ""
+    vendor_id = VENDOR_CAPTURE.search(device)
+    if vendor_id:
+        vid = vendor_id.group(1)
+
+    product_id = PRODUCT_CAPTURE.search(device)
+    if product_id:
+        pid = product_id.group(1)
+
+    revision_id = REVISION_CAPTURE.search(device)
+    if revision_id:
+        rev = revision_id.group(1)
+
+    # Capture uid info
+    device_path = device.split("\\")
+    if len(device_path) > 2:
+        uid = device_path[2]
+    if vid == "" and pid == "":
+        return None
+    return {"Vendor ID": vid, "Product ID": pid, "Revision": rev, "UID": uid}
+
+
+def new_aggregate():
+    """Create an empty fleet aggregate
+    : Input: None
+    : Output: A dictionary holding the device histories, the eviction heap and the count of dropped devices"""
+    return {"Devices": {}, "Heap": [], "Dropped Devices": 0, "Dropped Installs": 0}
+
+
+def aggregate_devices(device_dict, host, aggregate=None, max_devices=MAX_TRACKED_DEVICES):
+    """Fold the install events of one parsed log into a fleet aggregate
+    : Input: Devices dictionary of a parsed log, name of the host the log belongs to,
+    :        the aggregate to update (a new one is created if None) and the maximum number of tracked devices
+    : Output: The aggregate, its devices are keyed by (vendor id, product id, serial)"""
+    if aggregate is None:
+        aggregate = new_aggregate()
+
+    for device, dates in device_dict.items():
+        device_info = decode_device(device)
+        if not device_info:
+            continue
+        add_device_record(aggregate, (device_info["Vendor ID"], device_info["Product ID"], device_info["UID"]),
+                          {"First Seen": min(dates), "Last Seen": max(dates),
+                           "Install Count": len(dates), "Hosts": {host}},
+                          max_devices)
+    return aggregate
+
+
+def merge_aggregates(aggregate, other, max_devices=MAX_TRACKED_DEVICES):
+    """Merge a partial aggregate (e.g. computed by another worker) into an aggregate
+    : Input: The aggregate to update, the aggregate to merge into it and the maximum number of tracked devices
+    : Output: The updated aggregate"""
+    for key, record in other["Devices"].items():
+        add_device_record(aggregate, key, {"First Seen": record["First Seen"], "Last Seen": record["Last Seen"],
+                                           "Install Count": record["Install Count"], "Hosts": set(record["Hosts"])},
+                          max_devices)
+    aggregate["Dropped Devices"] += other["Dropped Devices"]
+    aggregate["Dropped Installs"] += other["Dropped Installs"]
+    return aggregate
+
+
+def add_device_record(aggregate, key, record, max_devices):
+    """Add a device history record to an aggregate, keeping at most max_devices devices
+    : Input: The aggregate, the device key, the device history and the maximum number of tracked devices
+    : Output: None"""
+    devices = aggregate["Devices"]
+    current = devices.get(key)
+    if current is None:
+        devices[key] = current = record
+    else:
+        current["First Seen"] = min(current["First Seen"], record["First Seen"])
+        current["Last Seen"] = max(current["Last Seen"], record["Last Seen"])
+        current["Install Count"] += record["Install Count"]
+        current["Hosts"] |= record["Hosts"]
+
+    # Every change pushes a new heap entry, the outdated entries are skipped when evicting
+    heap = aggregate["Heap"]
+    heapq.heappush(heap, (current["Install Count"], current["Last Seen"], key))
+    # Keep the memory bounded -> drop the least installed device once over the limit
+    # The new device is in the heap at this point, so it is the one dropped if it ranks lowest
+    if len(devices) > max_devices:
+        evict_device(aggregate)
+    # Rebuild the heap once the outdated entries make up most of it
+    if len(heap) > 2 * len(devices) + 1024:
+        heap[:] = [(device["Install Count"], device["Last Seen"], device_key)
+                   for device_key, device in devices.items()]
+        heapq.heapify(heap)
+
+
+def evict_device(aggregate):
+    """Drop the least installed device (oldest first on ties) from an aggregate and count it as dropped
+    : Input: The aggregate
+    : Output: None"""
+    devices = aggregate["Devices"]
+    heap = aggregate["Heap"]
+    while heap:
+        install_count, last_seen, key = heapq.heappop(heap)
+        device = devices.get(key)
+        # Skip the entries pushed before the device was updated or dropped
+        if device is None or device["Install Count"] != install_count or device["Last Seen"] != last_seen:
+            continue
+        del devices[key]
+        aggregate["Dropped Devices"] += 1
+        aggregate["Dropped Installs"] += install_count
+        return
+
+
+def rank_devices(aggregate):
+    """Rank the devices of an aggregate, most widespread first
+    : Input: The aggregate
+    : Output: A list of (device key, device history) sorted by host count, install count then first seen date"""
+    return sorted(aggregate["Devices"].items(), key=lambda item: (
+        -len(item[1]["Hosts"]), -item[1]["Install Count"], item[1]["First Seen"]))
+
+
+def print_fleet_table(aggregate, vendor_dict):
+    """Print the devices of an aggregate as a ranked table
+    : Input: The aggregate and the vendor dictionary to lookup names
+    : Output: None"""
+    row = "{:>4}  {:<8}  {:<12}  {:<24}  {:<20}  {:<20}  {:>5}  {:>8}  {:<19}  {:<19}"
+    header = row.format("Rank", "VID", "PID", "Serial", "Vendor Name", "Product Name",
+                        "Hosts", "Installs", "First Seen", "Last Seen")
+    print(header)
+    print("{:=^{}}".format("", len(header)))
+    for rank, ((vid, pid, serial), record) in enumerate(rank_devices(aggregate), 1):
+        vendor, product = usb_lookup(vid, pid, vendor_dict)
+        print(row.format(rank, vid[:8], pid[:12], serial[:24], vendor[:20], product[:20],
+                         len(record["Hosts"]), record["Install Count"],
+                         record["First Seen"].strftime(LOG_DATE_FORMAT), record["Last Seen"].strftime(LOG_DATE_FORMAT)))
+    print("{:=^{}}".format("", len(header)))
+    print("[*] Total device count: {}".format(len(aggregate["Devices"])))
+
+    # Dropped devices have lost their history -> a device seen again after being dropped is reported partially
+    if aggregate["Dropped Devices"]:
+        print("[-] Warning! {} devices ({} installs) were dropped after reaching the limit of tracked devices, "
+              "the histories above may be incomplete".format(aggregate["Dropped Devices"], aggregate["Dropped Installs"]))
+
+
+def find_logs(path):
+    """Locate the setupapi logs of a collection
+    : Input: Path to a directory containing one folder per host
+    : Output: A list of (log path, host name, Windows XP log or not)"""
+    logs = []
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            if file_name.lower() not in ("setupapi.dev.log", "setupapi.log"):
+                continue
+            log_file = os.path.join(root, file_name)
+            # The host is the top level folder under the given directory
+            # or the given directory itself for the logs directly inside it
+            if os.path.samefile(root, path):
+                host = os.path.basename(os.path.abspath(path))
+            else:
+                host = os.path.relpath(log_file, path).split(os.sep)[0]
+            logs.append((log_file, host, file_name.lower() == "setupapi.log"))
+    return logs
+
+
+# The result cache (hash_file() to evict_cache()) is duplicated in recent_run/recent_run.py since both scripts are standalone
+# -> keep both copies in sync when changing it
+def hash_file(file_path):
+    """Compute the BLAKE2 digest of a file by reading it in chunks
+    : Input: Path to the file
+    : Output: Hex digest of the file content"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, "rb") as artifact:
+        for chunk in iter(lambda: artifact.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(file_path, options):
+    """Build the cache key of an artifact
+    : Input: Path to the artifact and a string describing the parser options
+    : Output: Key made from the content hash, the parser version and the options"""
+    key = "{}|{}|{}".format(hash_file(file_path), PARSER_VERSION, options)
+    return hashlib.blake2b(key.encode(), digest_size=32).hexdigest()
+
+
+def cache_load(key):
+    """Load a parse result from the cache
+    : Input: Cache key
+    : Output: The cached result or None if the key is not in the cache"""
+    cache_file = os.path.join(CACHE_DIR, "{}.json".format(key))
+    try:
+        with open(cache_file, "r") as cached:
+            result = json.load(cached)
+        # Touch the entry so that the eviction sees it as recently used
+        os.utime(cache_file)
+    except (OSError, ValueError):
+        return None
+    return result
+
+
+def cache_store(key, result):
+    """Store a parse result in the cache then evict the least recently used entries if the cache is too large
+    : Input: Cache key and the result to store
+    : Output: None"""
+    global cache_size
+    cache_file = os.path.join(CACHE_DIR, "{}.json".format(key))
+    # Each process writes to its own temporary file so that concurrent runs do not collide
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    # A cache failure should never stop the parsing -> ignore write errors
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_file, "w") as cached:
+            json.dump(result, cached)
+        entry_size = os.path.getsize(tmp_file)
+        replaced_size = os.path.getsize(
+            cache_file) if os.path.exists(cache_file) else 0
+        os.replace(tmp_file, cache_file)
+
+        # Only list the cache directory on the first write, then keep track of its size
+        if cache_size is None:
+            cache_size = directory_size()
+        else:
+            cache_size += entry_size - replaced_size
+        if cache_size > CACHE_MAX_SIZE:
+            evict_cache()
+    except OSError:
+        pass
+
+
+def cache_entries():
+    """List the entries of the cache, skipping the temporary files being written
+    : Input: None
+    : Output: A list of (modification time, size, file name)"""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            entry = os.stat(os.path.join(CACHE_DIR, name))
+        except FileNotFoundError:
+            # Removed by another process in the meantime
+            continue
+        entries.append((entry.st_mtime, entry.st_size, name))
+    return entries
+
+
+def directory_size():
+    """Compute the size of the cache
+    : Input: None
+    : Output: Total size of the cache entries in bytes"""
+    return sum(size for _, size, _ in cache_entries())
+
+
+def evict_cache():
+    """Remove the least recently used cache entries until the cache fits in CACHE_MAX_SIZE
+    : Input: None
+    : Output: None"""
+    global cache_size
+    entries = cache_entries()
+    cache_size = sum(size for _, size, _ in entries)
+    # Oldest modification time first -> least recently used first
+    for _, size, name in sorted(entries):
+        if cache_size <= CACHE_MAX_SIZE:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+
+
+def cache_load_devices(key):
+    """Load a parsed log from the cache
+    : Input: Cache key
+    : Output: A devices dictionary or None if the key is not in the cache"""
+    device_dict = cache_load(key)
+    if device_dict is None:
+        return None
+    # Install dates are stored as iso format strings in the cache
+    return {device: [datetime.fromisoformat(date) for date in dates] for device, dates in device_dict.items()}
+
+
+def cache_store_devices(key, device_dict):
+    """Store a parsed log in the cache
+    : Input: Cache key and the devices dictionary
+    : Output: None"""
+    cache_store(key, {device: [date.isoformat() for date in dates]
+                      for device, dates in device_dict.items()})
+
+
+def parse_log_date(date_string):
+    """Parse a setupapi log date using its fixed format (yyyy/mm/dd hh:mm:ss[.mmm])
+    : Input: The date string
+    : Output: A datetime or None if the string is not a valid date"""
+    try:
+        millisecond = 0
+        if date_string[19:20] == ".":
+            millisecond = int(date_string[20:23].ljust(3, "0"))
+        return datetime(int(date_string[0:4]), int(date_string[5:7]), int(date_string[8:10]),
+                        int(date_string[11:13]), int(date_string[14:16]), int(date_string[17:19]),
+                        millisecond * 1000)
+    except ValueError:
+        return None
+
+
+def device_id_tokens(vid_pid):
+    """Build the substrings that a device string must contain to match a VID/PID set
+    : Input: A set of (vendor id, product id) where product id can be None to match every product of the vendor
+    : Output: A list of (vendor substrings, product substrings), or None if vid_pid is None"""
+    if vid_pid is None:
+        return None
+    id_tokens = []
+    for vid, pid in vid_pid:
+        vendor_tokens = ("vid_{}&".format(vid.lower()),
+                         "ven_{}&".format(vid.lower()))
+        product_tokens = ()
+        if pid is not None:
+            product_tokens = tuple("{}_{}{}".format(prefix, pid.lower(), end)
+                                   for prefix in ("pid", "dev", "prod") for end in ("&", "\\"))
+        id_tokens.append((vendor_tokens, product_tokens))
+    return id_tokens
+
+
+def match_device(device_info, id_tokens, device_class):
+    """Check if a device string matches the device filters without decoding it
+    : Input: Device string, tokens from device_id_tokens() and the device class (E.g: usb, usbstor)
+    : Output: True if the device matches the filters"""
+    # The device class is the enumerator in front of the first backslash
+    if device_class is None:
+        if not device_info.startswith("usb"):
+            return False
+    elif device_info.split("\\", 1)[0] != device_class:
+        return False
+
+    if id_tokens is None:
+        return True
+    for vendor_tokens, product_tokens in id_tokens:
+        if any(token in device_info for token in vendor_tokens):
+            if not product_tokens or any(token in device_info for token in product_tokens):
+                return True
+    return False
+
+
+def in_window(date_string, start_text, end_text):
+    """Check if a log date is inside the time window by comparing the fixed format strings
+    : Input: The date string and the window bounds formatted with LOG_DATE_FORMAT (None for no bound)
+    : Output: True if the date is inside the window (bounds included)"""
+    date_string = date_string[:19]
+    if start_text is not None and date_string < start_text:
+        return False
+    if end_text is not None and date_string > end_text:
+        return False
+    return True
+
+
+def filter_devices(device_dict, start=None, end=None, vid_pid=None, device_class=None):
+    """Apply the parser filters to an unfiltered parsed log (E.g: loaded from the cache)
+    : Input: Devices dictionary, the time window (datetimes, None for no bound),
+    :        a set of (vendor id, product id) and the device class (E.g: usb, usbstor) to look for
+    : Output: A dictionary of the matching device strings and their install dates inside the window"""
+    if start is None and end is None and vid_pid is None and device_class is None:
+        return device_dict
+
+    id_tokens = device_id_tokens(vid_pid)
+    start_text = start.strftime(LOG_DATE_FORMAT) if start else None
+    end_text = end.strftime(LOG_DATE_FORMAT) if end else None
+    filtered_dict = {}
+    for device_info, dates in device_dict.items():
+        if not match_device(device_info, id_tokens, device_class):
+            continue
+        # Compare the fixed format strings -> the window bounds are checked to the second
+        dates = [date for date in dates if in_window(
+            date.strftime(LOG_DATE_FORMAT), start_text, end_text)]
+        if dates:
+            filtered_dict[device_info] = dates
+    return filtered_dict
+
+
+def parse_device_from_log(log_file, start=None, end=None, vid_pid=None, device_class=None):
     """Parsing the api log file for important data
-    : Input: Path to the api log file
-    : Output: A dictionary contain the device information string and its install date"""
-    # Start declare a dictionary for storing result
-    device_dict = {}
-
-    with open(log_file, "r") as api_log:
-        for line in api_log:
-            # Search for string that indicate installation of new devices
-            if "device install (hardware initiated)" in line.lower() and ("ven" in line.lower() or "vid" in line.lower()):
-                # Extract information from the line with indicator and the next line which contains the install date
-                device_info = line.split(
-                    "-")[1].lower().replace("]", "").strip()
-                date_install = next(api_log).split(
-                    "start")[1].strip().lower()
-
-                # Only add the records that start with "usb" for usb information
-                if device_info.startswith("usb"):
-                    device_dict[device_info] = date_install
-    return device_dict
-
-
-def parse_device_winxp(log_file):
-    """Parsing the api log file from Windows XP for important data 
-    : Input: Path to the api log file (Windows XP)
-    : Output: A dictionary contain the device information string and its install date"""
-    # Initialize device dictionary
-    device_dict = {}
-    with open(log_file, "r") as api_log:
-        for line in api_log:
-            # Search for string that indicate installation of new devices
-            if "driver install]" in line.lower():
-                # Extract the install date and the string after that which indicate the hardware that is installed
-                date_install = " ".join(line.split(" ")[
-                                        :3]).replace("[", "").strip()
-                device_info = next(api_log).split(" ")[-1].strip()
-
-                # Only extract the devices that start with "usb"
-                if device_info.startswith("usb"):
-                    device_dict[device_info] = date_install
-    return device_dict
+    : Input: Path to the api log file, the time window (datetimes, None for no bound),
+    :        a set of (vendor id, product id) and the device class (E.g: usb, usbstor) to look for
+    : Output: A dictionary contain the device information string and its install dates"""
+    # The cache holds the unfiltered parse of each log -> parse the log only if it is not cached yet
+    key = cache_key(log_file, "win7")
+    device_dict = cache_load_devices(key)
+    if device_dict is None:
+        # Start declare a dictionary for storing result
+        device_dict = {}
+
+        with open(log_file, "r") as api_log:
+            for line in api_log:
+                # Search for string that indicate installation of new devices
+                lower_line = line.lower()
+                if "device install (hardware initiated)" in lower_line and ("ven" in lower_line or "vid" in lower_line):
+                    # Extract information from the line with indicator and the next line which contains the install date
+                    device_info = lower_line.split(
+                        "-")[1].replace("]", "").strip()
+                    date_string = next(api_log).split("start")[1].strip()
+
+                    # Only add the records that start with "usb" for usb information
+                    if not device_info.startswith("usb"):
+                        continue
+                    date_install = parse_log_date(date_string)
+                    if date_install is None:
+                        print("[-] Invalid install date: {}".format(date_string))
+                        continue
+                    device_dict.setdefault(
+                        device_info, []).append(date_install)
+        cache_store_devices(key, device_dict)
+
+    # Filter the parsed log so that later queries with other filters reuse the same cache entry
+    return filter_devices(device_dict, start, end, vid_pid, device_class)
+
+
+def parse_device_winxp(log_file, start=None, end=None, vid_pid=None, device_class=None):
+    """Parsing the api log file from Windows XP for important data
+    : Input: Path to the api log file (Windows XP), the time window (datetimes, None for no bound),
+    :        a set of (vendor id, product id) and the device class (E.g: usb, usbstor) to look for
+    : Output: A dictionary contain the device information string and its install dates"""
+    # The cache holds the unfiltered parse of each log -> parse the log only if it is not cached yet
+    key = cache_key(log_file, "winxp")
+    device_dict = cache_load_devices(key)
+    if device_dict is None:
+        # Initialize device dictionary
+        device_dict = {}
+        with open(log_file, "r") as api_log:
+            for line in api_log:
+                # Search for string that indicate installation of new devices
+                if "driver install]" in line.lower():
+                    # Extract the install date and the string after that which indicate the hardware that is installed
+                    date_string = line.lstrip("[")
+                    device_info = next(api_log).split(" ")[-1].strip()
+
+                    # Only extract the devices that start with "usb"
+                    if not device_info.startswith("usb"):
+                        continue
+                    date_install = parse_log_date(date_string)
+                    if date_install is None:
+                        print("[-] Invalid install date: {}".format(
+                            date_string.strip()))
+                        continue
+                    device_dict.setdefault(
+                        device_info, []).append(date_install)
+        cache_store_devices(key, device_dict)
+
+    # Filter the parsed log so that later queries with other filters reuse the same cache entry
+    return filter_devices(device_dict, start, end, vid_pid, device_class)
+
+
+def query_devices(logs, start=None, end=None, vid_pid=None, device_class=None):
+    """Parse the logs with the given filters and aggregate the matching devices
+    : Input: A list of (log path, host name, Windows XP log or not), the time window (datetimes, None for no bound),
+    :        a set of (vendor id, product id) and the device class (E.g: usb, usbstor) to look for
+    : Output: The aggregate of the matching devices"""
+    aggregate = new_aggregate()
+    for log_file, host, winxp in logs:
+        # Use WinXP parser if the log is from Windows XP system
+        if winxp:
+            devices_dict = parse_device_winxp(
+                log_file, start, end, vid_pid, device_class)
+
+        # Else (From Windows 7 or higher) -> Parse it normally
+        else:
+            # Parsing device infromation from log file
+            devices_dict = parse_device_from_log(
+                log_file, start, end, vid_pid, device_class)
+        aggregate_devices(devices_dict, host, aggregate)
+    return aggregate
+
+
+def parse_vid_pid(vid_pid_input):
+    """Parse the VID/PID filter entered by the user
+    : Input: Comma separated list of VID:PID or VID (E.g: 0781:5567,058f)
+    : Output: A set of (vendor id, product id) or None if the input is empty"""
+    if not vid_pid_input.strip():
+        return None
+    vid_pid = set()
+    for device_id in vid_pid_input.split(","):
+        vid, _, pid = device_id.strip().partition(":")
+        vid_pid.add((vid, pid or None))
+    return vid_pid
 
 
 def main():
     """The main function
-    : This function is going to parse the information from log file then look up on the USB database to display informative output"""
-    # As user for the log file location
-    log_file = input("Enter the path to your log file: ")
+    : This function is going to parse the information from log files then look up on the USB database to display a ranked device table"""
+    # As user for the log file or the collection location
+    log_path = input(
+        "Enter the path to your log file or to a directory of logs (one folder per host): ")
 
     # Check to see if file exist
-    if not os.path.isfile(log_file):
+    if os.path.isfile(log_path):
+        # Prompting users for log type
+        win_version = input("Is the log file from Windows XP? (y/n) ")
+        while win_version.lower() != "y" and win_version.lower() != "n":
+            print("[-] Invalid option! Only (y/n) is allow")
+            win_version = input("Is the log file from Windows XP? (y/n) ")
+        # Ask for the host name, the log path is used if none is given
+        host = input(
+            "Enter the host name of the log (default: the log path): ") or os.path.abspath(log_path)
+        logs = [(log_path, host, win_version.lower() == "y")]
+    elif os.path.isdir(log_path):
+        # The log type is known from the file name (setupapi.log on Windows XP)
+        logs = find_logs(log_path)
+    else:
         print("[-] Error! File does not exist!")
         sys.exit(1)
 
-    # Prompting users for log type
-    win_version = input("Is the log file from Windows XP? (y/n) ")
-    while win_version.lower() != ("y" or "n"):
-        print("[-] Invalid option! Only (y/n) is allow")
-        win_version = input("Is the log file from Windows XP? (y/n) ")
-
-    # Use WinXP parser if the log is from Windows XP system
-    if win_version.lower() == "y":
-        devices_dict = parse_device_winxp(log_file)
-
-    # Else (From Windows 7 or higher) -> Parse it normally
-    else:
-        # Parsing device infromation from log file
-        devices_dict = parse_device_from_log(log_file)
+    # Prompting users for the optional filters
+    start = input("Enter the start date (yyyy/mm/dd, empty for no limit): ")
+    while start and parse_log_date(start + " 00:00:00") is None:
+        print("[-] Invalid date! Only yyyy/mm/dd is allow")
+        start = input("Enter the start date (yyyy/mm/dd, empty for no limit): ")
+    end = input("Enter the end date (yyyy/mm/dd, empty for no limit): ")
+    while end and parse_log_date(end + " 23:59:59") is None:
+        print("[-] Invalid date! Only yyyy/mm/dd is allow")
+        end = input("Enter the end date (yyyy/mm/dd, empty for no limit): ")
+    vid_pid = parse_vid_pid(
+        input("Enter the VID:PID to look for (E.g: 0781:5567,058f, empty for all): "))
+    device_class = input(
+        "Enter the device class to look for (E.g: usb, usbstor, empty for all): ").lower() or None
+
+    aggregate = query_devices(logs, parse_log_date(start + " 00:00:00") if start else None,
+                              parse_log_date(end + " 23:59:59") if end else None, vid_pid, device_class)
 
     # Escape if no entry for USB is found
-    if not devices_dict:
+    if not aggregate["Devices"]:
         print("[-] Could not find any entry for USB! Exiting...")
         sys.exit(1)
-    # Parsing information from the web page and process the information
+    # Parsing information from the web page and print the ranked devices
     vendor_dict = parse_database_info()
-    devices = process_device_info(devices_dict)
-    for device in devices:
-        # Print banner to separate results
-        print("{:=^50}".format(""))
-
-        # Lookup the Vendor ID and Product ID to get their names
-        vendor, product = usb_lookup(
-            device["Vendor ID"], device["Product ID"], vendor_dict)
-        print("Vendor Name: {}".format(vendor))
-        print("Product Name: {}".format(product))
-
-        # Print out the data received from device string
-        for info, data in device.items():
-            print("{}: {}".format(info, data))
-    print("{:=^50}".format(""))
+    print_fleet_table(aggregate, vendor_dict)
 
 
 if __name__ == "__main__":